@@ -0,0 +1,88 @@
+"""Check that importing the showme command line stays cheap.
+
+Runs a fresh interpreter with ``-X importtime`` and fails if the import time
+over that of a bare interpreter exceeds the budget or if any of the heavy
+dependencies are imported before they are needed.
+
+    python benchmarks/import_time.py --budget 150
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+ROOT = os.path.dirname(HERE)
+
+MODULES = ['showme', 'showme.showme', 'showme.crawling', 'showme.scraping']
+HEAVY_MODULES = ['aiohttp', 'asyncio_throttle', 'bs4', 'lxml', 'requests', 'tkinter']
+
+
+def run_python(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def import_times(modules):
+    """Return list of (self_us, cumulative_us, name) for importing modules."""
+    code = f'import {", ".join(modules)}' if modules else 'pass'
+    result = run_python('-X', 'importtime', '-c', code)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return times
+
+
+def total_ms(modules, repeat):
+    """Return the best of repeat total import times in milliseconds."""
+    return min(sum(self_us for self_us, _, _ in import_times(modules)) / 1000 for _ in range(repeat))
+
+
+def imported_heavy_modules(modules):
+    """Return heavy modules that get imported as a side effect of modules."""
+    code = (f'import sys, {", ".join(modules)}; '
+            f'print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+    return run_python('-c', code).stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check showme import time budget')
+    parser.add_argument('--budget', type=float, default=150.0,
+                        help='maximum import time over interpreter startup in milliseconds (default: 150)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of measurements, the best is used (default: 5)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest imports to show')
+    args = parser.parse_args()
+
+    # Warm the bytecode cache so the measurement is of imports, not compiles
+    run_python('-c', f'import {", ".join(MODULES)}')
+
+    startup_ms = total_ms([], args.repeat)
+    import_ms = total_ms(MODULES, args.repeat) - startup_ms
+
+    print(f'Import time: {import_ms:.1f} ms over {startup_ms:.1f} ms startup (budget {args.budget:.1f} ms)')
+    times = import_times(MODULES)
+    for self_us, cumulative_us, name in sorted(times, reverse=True)[:args.top]:
+        print(f'  {self_us / 1000:8.2f} ms self {cumulative_us / 1000:8.2f} ms cumulative  {name.strip()}')
+
+    failed = False
+    if import_ms > args.budget:
+        print(f'FAIL: import time over budget by {import_ms - args.budget:.1f} ms')
+        failed = True
+
+    heavy = imported_heavy_modules(MODULES)
+    if heavy:
+        print(f'FAIL: heavy modules imported at startup: {", ".join(heavy)}')
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
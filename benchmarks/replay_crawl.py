@@ -0,0 +1,50 @@
+"""Measure crawl throughput by replaying a recorded archive.
+
+Record a crawl first, then replay it to time the parsing and pipeline stages
+without any network variance.
+
+    showme "https://example.com/c/men" -o men.csv --record men.warc.gz
+    python benchmarks/replay_crawl.py men.warc.gz "https://example.com/c/men" --repeat 5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import showme.crawling  # noqa: E402
+
+
+def replay(archive, urls, outfile):
+    crawler = showme.crawling.Crawler(urls, outfile, replay=archive)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    asyncio.run(crawler.crawl())
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    with open(outfile) as file:
+        rows = sum(1 for _ in file) - 1
+
+    return wall, cpu, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded crawl and report throughput')
+    parser.add_argument('archive', help='archive written by showme --record')
+    parser.add_argument('urls', nargs='+', help='category URLs the crawl was recorded with')
+    parser.add_argument('--repeat', type=int, default=3, help='number of replays (default: 3)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outfile = os.path.join(tmp, 'replay.csv')
+        for run in range(args.repeat):
+            wall, cpu, rows = replay(args.archive, args.urls, outfile)
+            print(f'run {run + 1}: {rows} rows in {wall:.3f} s wall, {cpu:.3f} s CPU ({rows / wall:.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,20 @@
 import os
+import re
 import setuptools
 
 import fastentrypoints
-import showme
 
 here = os.path.abspath(os.path.dirname(__file__))
 with open(os.path.join(here, 'README.md'), encoding='utf-8') as f:
     long_description = f.read()
 
+# Read the version without importing showme (and its dependencies)
+with open(os.path.join(here, 'showme', '__init__.py'), encoding='utf-8') as f:
+    version = re.search(r"^__version__ = ['\"]([^'\"]*)['\"]", f.read(), re.M).group(1)
+
 setuptools.setup(
     name='showme',
-    version=showme.__version__,
+    version=version,
     description='Quickly get product properties.',
     long_description=long_description,
     long_description_content_type='text/markdown',
@@ -31,7 +35,11 @@ setuptools.setup(
         'lxml',
         'progressbar2',
         'aiohttp',
+        'asyncio-throttle',
     ],
+    extras_require={
+        'http2': ['httpx[http2]'],
+    },
     entry_points={
         'console_scripts': [
             'showme = showme.showme:_command_line',
@@ -0,0 +1,106 @@
+"""Showme, a simple web crawler -- recording and replaying HTTP responses.
+
+An archive is a sequence of gzip members, one per response, so any record can
+be decompressed on its own. Each record is a JSON header line (url, status,
+headers) followed by the raw body. A sidecar index file, ``<archive>.idx``,
+holds one JSON line per record with its url, offset and length.
+
+RecordingTransport and ReplayTransport plug archives in to Crawler.fetch.
+"""
+
+import gzip
+import json
+import logging
+import mmap
+
+from showme.transport import Response
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ReplayMissError(LookupError):
+    """Requested URL is not in the archive being replayed."""
+
+
+def index_filename(filename):
+    return str(filename) + '.idx'
+
+
+class ArchiveWriter:
+    def __init__(self, filename):
+        self.filename = str(filename)
+        self._file = open(self.filename, 'wb')
+        self._index = open(index_filename(self.filename), 'w', encoding='utf-8')
+
+    def write(self, url, status, headers, body):
+        """Append a response, headers is an iterable of (name, value) pairs."""
+        header = json.dumps({'url': url, 'status': status, 'headers': list(headers)})
+        record = gzip.compress(header.encode('utf-8') + b'\n' + body, compresslevel=6)
+        offset = self._file.tell()
+        self._file.write(record)
+        self._index.write(json.dumps({'url': url, 'offset': offset, 'length': len(record)}) + '\n')
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+
+class ArchiveReader:
+    def __init__(self, filename):
+        self.filename = str(filename)
+        self._file = open(self.filename, 'rb')
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty archives cannot be mapped
+            self._data = b''
+
+        # Later records for the same URL replace earlier ones
+        self.index = dict()
+        with open(index_filename(self.filename), encoding='utf-8') as file:
+            for line in file:
+                entry = json.loads(line)
+                self.index[entry['url']] = (entry['offset'], entry['length'])
+        LOGGER.info('Replaying %d responses from %s', len(self.index), self.filename)
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def read(self, url):
+        try:
+            offset, length = self.index[url]
+        except KeyError:
+            raise ReplayMissError(url) from None
+        header, _, body = gzip.decompress(self._data[offset:offset + length]).partition(b'\n')
+        header = json.loads(header)
+        return Response(header['url'], header['status'], header['headers'], body)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+class RecordingTransport:
+    '''Transport writing every response from another transport to an archive'''
+    def __init__(self, transport, filename):
+        self.transport = transport
+        self.writer = ArchiveWriter(filename)
+
+    async def get(self, url):
+        response = await self.transport.get(url)
+        self.writer.write(url, response.status, response.headers, response.body)
+        return response
+
+    async def close(self):
+        await self.transport.close()
+        self.writer.close()
+
+
+class ReplayTransport(ArchiveReader):
+    '''Transport serving responses from an archive instead of the network'''
+    async def get(self, url):
+        return self.read(url)
+
+    async def close(self):
+        ArchiveReader.close(self)
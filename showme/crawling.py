@@ -1,19 +1,26 @@
 import argparse
 import asyncio
+import collections
+import contextlib
 import logging
 import pathlib
 import os
+import queue
 import sys
+import threading
 import time
 import random
-from pprint import pprint
-import aiohttp
 import urllib.parse
+import showme.archive
 import showme.scraping
+import showme.store
+import showme.transport
 from collections import namedtuple
 import csv
 import datetime
-from asyncio_throttle import Throttler
+import json
+
+# asyncio_throttle is imported in Crawler.crawl to keep startup fast
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(logging.NullHandler())
@@ -56,84 +63,266 @@ class Job:
     async def go(self):
         await self.callback(self)
 
+# Every output column, in output order
+FIELDS = ['name',  'color_name', 'productSKUCode', 'style', 'color', 'upc', 'price', 'list_price', 'sale_price', 'availability', 'desc', 'url']
+
+# Output columns that can be filled from category page data alone
+CATEGORY_PAGE_FIELDS = {'url', 'style', 'color', *showme.scraping.CATEGORY_PRODUCT_FIELDS}
+
+# kind is one of 'started', 'progress', 'error', 'cancelled' or 'finished'.
+# 'finished' is always the last event published by a crawl.
+ProgressEvent = namedtuple('ProgressEvent', ['kind', 'source', 'total', 'remaining', 'rate', 'error'])
+
+class ProgressChannel:
+    '''Thread-safe channel carrying ProgressEvents from crawlers to a consumer
+
+    notify is called (from the publishing thread) when an event is queued and
+    none were waiting, letting the consumer wake up instead of polling. It is
+    not called again until the consumer drains the channel.
+    '''
+    def __init__(self, notify=None):
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._notified = False
+        self.notify = notify
+
+    def publish(self, event):
+        self._queue.put(event)
+        with self._lock:
+            if self._notified:
+                return
+            self._notified = True
+        if self.notify is not None:
+            self.notify()
+
+    def drain(self):
+        '''Return all events published since the last drain'''
+        # Clear first so events published while draining notify again
+        with self._lock:
+            self._notified = False
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+class BackgroundLoop:
+    '''Event loop running in a daemon thread that crawls can be submitted to
+
+    Several crawls may run concurrently on the one loop. submit returns a
+    concurrent.futures.Future, cancelling it cancels the crawl.
+    '''
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='showme-loop', daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        if not self.thread.is_alive():
+            self.thread.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self, timeout=None):
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
+
+class ResponseCache:
+    '''LRU of recently decoded responses, entries expire after ttl seconds'''
+    def __init__(self, maxsize=256, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+
+    def __getitem__(self, key):
+        expires, value = self._entries[key]
+        if expires < time.monotonic():
+            del self._entries[key]
+            raise KeyError(key)
+        self._entries.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
 class Crawler:
-    def __init__(self, urls, outfile):  
+    def __init__(self, urls, outfile, progress=None, record=None, replay=None, store=None, fields=None,
+                 transport='aiohttp', profiler=None, throttler=None, cache=None, crawl=None):  
         self.urls = urls 
         self.max_workers = 2
         self.request_queue_depth = 20
         self.request_queue = None
         self.seen_urls = set()
         self.seen_styles = set()
-
-        self.session = None
-        self.worker_tasks = None
-
-        self.throttler = None
+        self.seen_products = set()
+
+        # Replay serves everything from the archive at full speed, unthrottled
+        if replay:
+            self.transport = showme.archive.ReplayTransport(replay)
+        elif isinstance(transport, str):
+            self.transport = showme.transport.get_transport(transport)
+        elif transport is None:
+            raise ValueError('transport must be a transport or one of: ' + ', '.join(sorted(showme.transport.TRANSPORTS)))
+        else:
+            self.transport = transport
+        if record:
+            self.transport = showme.archive.RecordingTransport(self.transport, record)
+        self.replay = replay
+
+        # Fetches in progress and recent JSON responses, keyed by canonical URL
+        self.inflight = dict()
+        self.response_cache = ResponseCache() if cache is None else cache
+        self.worker_tasks = []
+        self.health_tasks = []
+
+        # A throttler may be shared by crawls against the same server
+        self.throttler = throttler
         # timestamp = str(datetime.datetime.fromtimestamp(time.time()).strftime("%Y-%m-%d_%H%M%S"))
         self.filename = str(outfile)
-        self.csvfieldnames = ['name',  'color_name', 'productSKUCode', 'style', 'color', 'upc', 'price', 'list_price', 'sale_price', 'availability', 'desc', 'url']
-        self.csvwriter = CSVScribe(self.filename, self.csvfieldnames)
+        if fields:
+            unknown = [field for field in fields if field not in FIELDS]
+            if unknown:
+                raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+            self.csvfieldnames = list(fields)
+            self.csvwriter = CSVScribe(self.filename, self.csvfieldnames, extrasaction='ignore')
+        else:
+            self.csvfieldnames = list(FIELDS)
+            self.csvwriter = CSVScribe(self.filename, self.csvfieldnames)
+        # crawl tags the rows written to the store, the start time by default
+        self.store = showme.store.SQLiteScribe(store, FIELDS, crawl=crawl) if store else None
+
+        # When category pages hold every requested column, skip stage 3
+        self.light = bool(fields) and set(fields) <= CATEGORY_PAGE_FIELDS
+        self.category_product_fields = set(self.csvfieldnames) & set(showme.scraping.CATEGORY_PRODUCT_FIELDS)
+        self.warned_missing_fields = False
         self.write_counter = 0
 
         self.product_total = 0
         self.product_remaining = 0
         self.percent_complete = 0.0
 
+        self.progress = progress
+        self.start_time = None
+        self.end_time = None
+
+        # showme.profiling.Profiler attributing time to stages, if profiling
+        self.profiler = profiler
+
     async def close(self):
-        await self.session.close()
+        await self.transport.close()
+        if self.store is not None:
+            self.store.close()
+
+    def timed(self, name, coro):
+        '''Attribute the time of coro to name when profiling'''
+        if self.profiler is None:
+            return coro
+        return self.profiler.timed(name, coro)
+
+    def section(self, name):
+        '''Attribute the time of a synchronous block to name when profiling'''
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.section(name)
+
+    def rate(self):
+        '''Products completed per second between the crawl starting and finishing'''
+        elapsed = (self.end_time or time.time()) - self.start_time
+        completed = self.product_total - self.product_remaining
+        return completed / elapsed if elapsed > 0 else 0.0
+
+    def log_progress(self):
+        '''Log one aggregated progress line, called periodically by heartbeat'''
+        LOGGER.info('%d of %d products complete (%.1f/s)', self.product_total - self.product_remaining,
+                    self.product_total, self.rate())
+
+    def publish(self, kind, error=None):
+        '''Publish a ProgressEvent if the crawler was given a progress channel'''
+        if self.progress is None:
+            return
+        rate = self.rate()
+        self.progress.publish(ProgressEvent(kind, self.filename, self.product_total, self.product_remaining, rate, error))
         
     async def crawl(self):
         """Run the crawler until all work is done.
         
-        This is the main execution coroutine for the crawler.
+        This is the main execution coroutine for the crawler. Cancelling it
+        stops the workers and closes the transport.
         """
-        # Queues must be created inside event loop (i.e. don't place in __init__)
-        self.request_queue = asyncio.Queue()
+        self.start_time = time.time()
+        self.publish('started')
+        try:
+            from asyncio_throttle import Throttler
 
-        # Clientsession should be created from async function (i.e. don't place in __init__)
-        self.session = aiohttp.ClientSession()
+            # Queues must be created inside event loop (i.e. don't place in __init__)
+            self.request_queue = asyncio.Queue()
 
-        self.throttler = Throttler(rate_limit=10, period=1)
+            if self.throttler is None and not self.replay:
+                self.throttler = Throttler(rate_limit=10, period=1)
+            if self.throttler is not None and self.profiler is not None:
+                self.throttler = self.profiler.throttled(self.throttler)
 
-        for url in self.urls:
-            await self.schedule(Job(url, self.stage1_request_category_data))
+            for url in self.urls:
+                await self.schedule(Job(url, self.stage1_request_category_data))
 
-        self.worker_tasks = [asyncio.create_task(self.worker(name=i)) for i in range(self.max_workers)]
+            self.worker_tasks = [asyncio.create_task(self.worker(name=i)) for i in range(self.max_workers)]
 
-        # Only needed if Windows and Python version < 3.8 
-        self.health_tasks = [asyncio.create_task(self.heartbeat()), ]
+            # Only needed if Windows and Python version < 3.8 
+            self.health_tasks = [asyncio.create_task(self.heartbeat()), ]
 
-        # When all work is done, exit.
-        await self.request_queue.join()
-        for worker in self.worker_tasks:
-            worker.cancel()
+            # When all work is done, exit.
+            await self.request_queue.join()
+        except asyncio.CancelledError:
+            LOGGER.info('Crawl cancelled: %s', self.filename)
+            self.publish('cancelled')
+            raise
+        except Exception as exc:
+            self.publish('error', error=repr(exc))
+            raise
+        finally:
+            for task in self.worker_tasks + self.health_tasks + list(self.inflight.values()):
+                task.cancel()
 
-        await self.close()
+            await self.close()
+            self.end_time = time.time()
+            self.log_progress()
+            self.publish('finished')
 
     async def schedule(self, job):
         if job.url not in self.seen_urls:
             await self.request_queue.put(job)
-            LOGGER.debug(f'Added item to queue, there are {self.request_queue.qsize()} jobs pending.')
+            LOGGER.debug('Added item to queue, there are %d jobs pending.', self.request_queue.qsize())
         else:
             self.product_remaining -= 1
-            LOGGER.warning(f'Skipping Seen URL: {job.url}')
-            LOGGER.info(f'{self.product_remaining} of {self.product_total} complete')
+            LOGGER.warning('Skipping Seen URL: %s', job.url)
+            self.publish('progress')
 
     async def worker(self, *, name=''):
         if name != '':
             name = ' ' + str(name)
             
-        LOGGER.info(f'Worker{name} started!')
+        LOGGER.info('Worker%s started!', name)
         while True:
-            LOGGER.debug(f'Worker{name} waiting...')
+            LOGGER.debug('Worker%s waiting...', name)
             job = await self.request_queue.get()
-            LOGGER.debug(f'Got item from queue, there are {self.request_queue.qsize()} jobs remaining.')
+            LOGGER.debug('Got item from queue, there are %d jobs remaining.', self.request_queue.qsize())
             try:
                 # # Download page and add new links to self.request_queue.
                 job.content = await self.fetch(job)
-                await job.go()
+                await self.timed(job.callback.__name__, job.go())
             except Exception as exc:
-                LOGGER.exception(f'The coroutine raised an exception: {exc!r}')
+                LOGGER.exception('The coroutine raised an exception: %r', exc)
+                self.publish('error', error=repr(exc))
                 # raise exc
             finally:
                 self.request_queue.task_done()
@@ -145,21 +334,53 @@ class Crawler:
             stopped = [worker for worker in self.worker_tasks if worker.done()]
             faulted = [worker for worker in self.worker_tasks if isinstance(worker._exception, Exception)]
             LOGGER.debug("heartbeat")
+            self.log_progress()
             if stopped or faulted:
-                LOGGER.warning(f'{len(stopped)}/{workers} workers stopped')
-                LOGGER.error(f'{len(faulted)}/{workers} workers faulted')
+                LOGGER.warning('%d/%d workers stopped', len(stopped), workers)
+                LOGGER.error('%d/%d workers faulted', len(faulted), workers)
                 for worker in faulted:
                     worker.cancel()
             await asyncio.sleep(5)
 
     async def fetch(self, job): 
-        async with self.throttler:
-            async with self.session.get(job.url) as response:
-                # assert str(response.url) == job.url
-                if job._json:
-                    return await response.json()
+        '''Fetch job.url, returning decoded JSON if job requires it
+
+        Concurrent fetches of the same canonical URL share one request and
+        JSON responses are served from response_cache while fresh.
+        '''
+        key = (canonical_url(job.url), job._json)
+        if job._json:
+            try:
+                return self.response_cache[key]
+            except KeyError:
+                pass
+
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.timed('fetch', self._fetch(job)))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            LOGGER.debug('Joining in-flight request: %s', job.url)
+
+        # Shield so one cancelled waiter does not cancel the request for all
+        content = await asyncio.shield(task)
+        if job._json:
+            self.response_cache[key] = content
+
+        return content
+
+    async def _fetch(self, job):
+        if self.throttler is None:
+            response = await self.transport.get(job.url)
+        else:
+            async with self.throttler:
+                response = await self.transport.get(job.url)
 
-                return await response.read()
+        if job._json:
+            return json.loads(response.body)
+
+        return response.body
 
     async def stage1_request_category_data(self, job):
         '''Given job with URL and HTML, request category_page_data'''
@@ -167,7 +388,9 @@ class Crawler:
         path = f'/**/c/{category}/getCategoryPageData?'
         category_page_data_url = urllib.parse.urljoin(job.url, path)
 
-        await self.schedule(Job(category_page_data_url, self.stage2_process_category_page, json=True))
+        category_job = Job(category_page_data_url, self.stage2_process_category_page, json=True)
+        category_job.payload = {'category': category}
+        await self.schedule(category_job)
 
     ProductURLDetails = namedtuple('URLDetails', ['none', 'language', 'title', 'type', 'code'])
 
@@ -184,30 +407,80 @@ class Crawler:
             # breakpoint()
             self.product_total += int(job.content['pagination']['totalNumberOfResults'])
             self.product_remaining += int(job.content['pagination']['totalNumberOfResults'])
+            self.publish('progress')
 
         if (current_page == 0) and (current_page < last_page-1):
             params = {'page': 0, 'q': ':relevance'}
             for page in range(current_page+1, last_page):
                 params['page'] = page
                 category_page_data_url = replace_url_params(job._url, params).geturl()
-                LOGGER.info(f'Requesting: {category_page_data_url}')
-                await self.schedule(Job(category_page_data_url, self.stage2_process_category_page, json=True))
+                LOGGER.info('Requesting: %s', category_page_data_url)
+                page_job = Job(category_page_data_url, self.stage2_process_category_page, json=True)
+                page_job.payload = job.payload
+                await self.schedule(page_job)
+
+        if self.light:
+            await self.write_category_products(job)
+            return
 
         # Parse product URLs and queue product requests
         products = showme.scraping.get_style_links(job.content['products'])
         product_details = [self.ProductURLDetails(*product.split('/')) for product in products]
         for item in product_details:
-            style, color = item.code.split('-')
-            if style in self.seen_styles:
-                LOGGER.debug(f'Skipping stage 3 request for {item.code}, already requested style.')
-                continue
-            self.seen_styles.add(style)
-            path = f'/en/p/{item.code}/detailSummary/getProductFeed2.json?currency=USD'
-            product_detail_summary_url = urllib.parse.urljoin(job.url, path)
-            LOGGER.info(f'Requesting: {product_detail_summary_url}')
-            job = Job(product_detail_summary_url, self.stage3_process_product_page, json=True)
-            job.payload = item
-            await self.schedule(job)
+            await self.schedule_product_page(item, job)
+
+    async def schedule_product_page(self, item, job):
+        '''Queue a stage 3 request for the style of item, once per style'''
+        style, color = item.code.split('-')
+        if style in self.seen_styles:
+            # Stage 3 writes every colour of the style, count this product as done
+            LOGGER.debug('Skipping stage 3 request for %s, already requested style.', item.code)
+            self.product_remaining -= 1
+            self.publish('progress')
+            return
+        self.seen_styles.add(style)
+        path = f'/en/p/{item.code}/detailSummary/getProductFeed2.json?currency=USD'
+        product_detail_summary_url = urllib.parse.urljoin(job.url, path)
+        LOGGER.info('Requesting: %s', product_detail_summary_url)
+        product_job = Job(product_detail_summary_url, self.stage3_process_product_page, json=True)
+        product_job.payload = {'product': item, 'category': job.payload.get('category')}
+        await self.schedule(product_job)
+
+    async def write_category_products(self, job):
+        '''Write output rows straight from category page data
+
+        Products missing a requested column are sent to stage 3 instead.
+        '''
+        for product in job.content['products']:
+            deferred = False
+            try:
+                product = showme.scraping.get_category_product(product)
+                if product is None:
+                    continue
+                item = self.ProductURLDetails(*product.pop('link').split('/'))
+
+                missing = self.category_product_fields - product.keys()
+                if missing:
+                    if not self.warned_missing_fields:
+                        LOGGER.warning('Category page data has no %s, requesting product pages instead',
+                                       ', '.join(sorted(missing)))
+                        self.warned_missing_fields = True
+                    # Stage 3 (or the seen style skip) counts the product as done
+                    deferred = True
+                    await self.schedule_product_page(item, job)
+                    continue
+
+                if item.code in self.seen_products:
+                    LOGGER.debug('Skipping %s, already written.', item.code)
+                    continue
+                self.seen_products.add(item.code)
+                product['style'], product['color'] = item.code.split('-')
+                product['url'] = urllib.parse.urljoin(job.url, f'/en/p/{item.code}')
+                self.write_row(product, job)
+            finally:
+                if not deferred:
+                    self.product_remaining -= 1
+        self.publish('progress')
 
     async def stage3_process_product_page(self, job):
         try:
@@ -233,16 +506,32 @@ class Crawler:
                 
                 try:
                     for size in product_summary['sizes']:
-                        size['style'], size['color'], _ = size['productSKUCode'].split('-')
-                        self.csvwriter({**output, **size})
+                        # Responses are shared between fetches, don't modify them
+                        row = {**output, **size}
+                        row['style'], row['color'], _ = size['productSKUCode'].split('-')
+                        self.write_row(row, job)
                 except KeyError:
-                    LOGGER.warning(f'No Size information: {product_url}')
+                    LOGGER.warning('No Size information: %s', product_url)
                     output['productSKUCode'] = product_summary.get('productSKUCode')
                     output['style'], output['color'], _ = output['productSKUCode'].split('-')
-                    self.csvwriter(output)
+                    self.write_row(output, job)
         finally:
             self.product_remaining -= 1
-            LOGGER.info(f'{self.product_remaining} of {self.product_total} complete')
+            self.publish('progress')
+
+    def write_row(self, row, job):
+        '''Write an output row to the CSV file and, if enabled, the store'''
+        with self.section('csv'):
+            self.csvwriter(row)
+        if self.store is not None:
+            with self.section('store'):
+                self.store({**row, 'category': job.payload.get('category')})
+
+def canonical_url(url):
+    '''Normalise a URL so equivalent requests share a key'''
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', query, ''))
 
 def replace_url_params(url, params):
     # https://stackoverflow.com/questions/2506379/add-params-to-given-url-in-python
@@ -250,9 +539,9 @@ def replace_url_params(url, params):
     return url._replace(query=urllib.parse.urlencode(params))
 
 class CSVScribe:
-    def __init__(self, filename, fields):
+    def __init__(self, filename, fields, extrasaction='raise'):
         self.filename = filename
-        self.dict_writer_parameters = {'fieldnames': fields, 'delimiter': ',', 'quotechar': '"', 'quoting': csv.QUOTE_MINIMAL, 'lineterminator': os.linesep}
+        self.dict_writer_parameters = {'fieldnames': fields, 'delimiter': ',', 'quotechar': '"', 'quoting': csv.QUOTE_MINIMAL, 'lineterminator': os.linesep, 'extrasaction': extrasaction}
         with open(self.filename, 'w', newline='') as file:
             csvwriter = csv.DictWriter(file, **self.dict_writer_parameters)
             csvwriter.writeheader()
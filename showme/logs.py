@@ -0,0 +1,71 @@
+"""Showme, a simple web crawler -- low overhead logging for the crawl hot path.
+
+start_queue_logging moves a logger's handlers to a listener thread so that
+formatting and writing (e.g. the DEBUG file handler) don't block the event
+loop. RateLimitFilter samples chatty per-request messages.
+"""
+
+import logging
+import logging.handlers
+import queue
+import time
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    '''QueueHandler for a listener in the same process
+
+    Records are queued as they are, formatting is left to the listener's
+    handlers instead of being done on the logging thread.
+    '''
+    def prepare(self, record):
+        return record
+
+
+def start_queue_logging(logger=None):
+    '''Move the handlers of logger (root by default) to a listener thread
+
+    Returns the started QueueListener, stop it before exiting to flush any
+    queued records.
+    '''
+    logger = logger or logging.getLogger()
+    handlers = logger.handlers[:]
+    log_queue = queue.SimpleQueue()
+
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(LocalQueueHandler(log_queue))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+class RateLimitFilter(logging.Filter):
+    '''Pass at most rate records per period for each message template
+
+    Records are grouped by their unformatted message, so log with %-style
+    arguments rather than f-strings. Records above level are never dropped.
+    '''
+    def __init__(self, rate=5, period=1.0, level=logging.INFO):
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self.level = level
+        self.windows = dict()
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+
+        now = time.monotonic()
+        start, count = self.windows.get(record.msg, (now, 0))
+        if now - start >= self.period:
+            start, count = now, 0
+        self.windows[record.msg] = (start, count + 1)
+        return count < self.rate
+
+
+def rate_limit(*names, rate=5, period=1.0):
+    '''Add a RateLimitFilter to each named logger'''
+    for name in names:
+        logging.getLogger(name).addFilter(RateLimitFilter(rate, period))
@@ -0,0 +1,214 @@
+"""Showme, a simple web crawler -- per-stage profiling of a crawl.
+
+Profiler attributes crawl time to stages. Each stage coroutine is stepped
+through a wrapper which measures the time spent running on the event loop
+(CPU) separately from the time spent suspended, awaiting the network or the
+throttler. Time spent in a nested stage is not counted as the outer stage's
+CPU time.
+
+A sampling profiler or cProfile can run alongside, the sampler writes stacks
+in the collapsed format read by flamegraph.pl and speedscope.
+"""
+
+import collections
+import contextlib
+import logging
+import sys
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class StageStats:
+    __slots__ = ('calls', 'wall', 'cpu', 'nested')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.nested = 0.0
+
+    @property
+    def own_cpu(self):
+        return self.cpu - self.nested
+
+    @property
+    def waiting(self):
+        return max(self.wall - self.cpu, 0.0)
+
+
+class Profiler:
+    def __init__(self):
+        self.stats = collections.defaultdict(StageStats)
+        # Stack of [stats, nested time] for the stages running right now
+        self._running = []
+        self._sampler = None
+        self._cprofile = None
+
+    def _enter(self):
+        entry = [None, 0.0]
+        self._running.append(entry)
+        return entry
+
+    def _exit(self, stats, elapsed):
+        _, nested = self._running.pop()
+        stats.cpu += elapsed
+        stats.nested += nested
+        if self._running:
+            self._running[-1][1] += elapsed
+
+    def timed(self, name, coro):
+        '''Return an awaitable running coro with its time attributed to name'''
+        return TimedCoroutine(self, self.stats[name], coro)
+
+    @contextlib.contextmanager
+    def section(self, name):
+        '''Attribute the time of a synchronous block (e.g. a CSV write) to name'''
+        stats = self.stats[name]
+        stats.calls += 1
+        self._enter()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.wall += elapsed
+            self._exit(stats, elapsed)
+
+    def throttled(self, throttler, name='throttler'):
+        '''Wrap throttler so time blocked waiting for a slot is attributed to name'''
+        return TimedThrottler(throttler, self.stats[name])
+
+    def start(self, mode='sampling', interval=0.005):
+        '''Start a sampling profiler of the calling thread, or cProfile'''
+        if mode == 'sampling':
+            self._sampler = StackSampler(threading.get_ident(), interval)
+            self._sampler.start()
+        elif mode == 'cprofile':
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif mode is not None:
+            raise ValueError(f'Unknown profile mode {mode!r}')
+
+    def stop(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+        if self._cprofile is not None:
+            self._cprofile.disable()
+
+    def report(self):
+        '''Return the per-stage breakdown as a text table'''
+        lines = [f'{"stage":<32} {"calls":>7} {"wall s":>9} {"cpu s":>9} {"waiting s":>10}']
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].wall):
+            lines.append(f'{name:<32} {stats.calls:>7} {stats.wall:>9.3f} {stats.own_cpu:>9.3f} {stats.waiting:>10.3f}')
+
+        if 'fetch' in self.stats:
+            fetch = self.stats['fetch']
+            throttled = self.stats['throttler'].wall if 'throttler' in self.stats else 0.0
+            lines.append('')
+            lines.append(f'fetch: {fetch.own_cpu:.3f} s cpu, {throttled:.3f} s blocked in throttler, '
+                         f'{max(fetch.waiting - throttled, 0.0):.3f} s awaiting network')
+        lines.append('')
+        lines.append('wall and waiting include nested stages, cpu does not.')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, prefix):
+        '''Write prefix.txt (breakdown) and prefix.folded or prefix.prof, return paths'''
+        paths = [f'{prefix}.txt']
+        with open(paths[0], 'w') as file:
+            file.write(self.report())
+
+        if self._sampler is not None:
+            paths.append(f'{prefix}.folded')
+            self._sampler.write(paths[-1])
+        if self._cprofile is not None:
+            paths.append(f'{prefix}.prof')
+            self._cprofile.dump_stats(paths[-1])
+
+        return paths
+
+
+class TimedCoroutine:
+    '''Awaitable stepping a coroutine and timing each step'''
+    def __init__(self, profiler, stats, coro):
+        self.profiler = profiler
+        self.stats = stats
+        self.coro = coro
+
+    def __await__(self):
+        profiler, stats, coro = self.profiler, self.stats, self.coro
+        stats.calls += 1
+        started = time.perf_counter()
+        value, error = None, None
+        try:
+            while True:
+                profiler._enter()
+                start = time.perf_counter()
+                try:
+                    if error is None:
+                        future = coro.send(value)
+                    else:
+                        future = coro.throw(error)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    profiler._exit(stats, time.perf_counter() - start)
+
+                try:
+                    value, error = (yield future), None
+                except BaseException as exc:
+                    value, error = None, exc
+        finally:
+            stats.wall += time.perf_counter() - started
+
+
+class TimedThrottler:
+    def __init__(self, throttler, stats):
+        self.throttler = throttler
+        self.stats = stats
+
+    async def __aenter__(self):
+        self.stats.calls += 1
+        start = time.perf_counter()
+        try:
+            return await self.throttler.__aenter__()
+        finally:
+            self.stats.wall += time.perf_counter() - start
+
+    async def __aexit__(self, *exc_info):
+        return await self.throttler.__aexit__(*exc_info)
+
+
+class StackSampler:
+    '''Sample the stack of one thread at an interval from a daemon thread'''
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='showme-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'.replace(';', ':'))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def write(self, filename):
+        with open(filename, 'w') as file:
+            for stack, count in self.counts.most_common():
+                file.write(f'{stack} {count}\n')
@@ -2,14 +2,23 @@ import collections
 import logging
 import pathlib
 import os
-import requests
-import bs4
+
+# requests, bs4 and lxml are imported where used to keep startup fast
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Output columns found in category page product data and the key holding each
+CATEGORY_PRODUCT_FIELDS = {
+    'name': 'name',
+    'price': 'price',
+    'list_price': 'listPrice',
+    'sale_price': 'salePrice',
+}
+
 
 def get_product_details(product_page, product_url):
+    import bs4
     pdp_content = bs4.BeautifulSoup(product_page, 'lxml')
 
     swatch_data = pdp_swatch_sets(pdp_content, product_url)
@@ -25,6 +34,7 @@ def get_product_details(product_page, product_url):
 
 def get_styles(domain, category):
     """Get list of products given domain and category"""
+    import requests
     req_parameters = {'page': 0, 'q': ':relevance'}
     req = requests.get(category_url(category, domain), req_parameters)
     req.raise_for_status()
@@ -67,10 +77,31 @@ def pdp_single(soup, address, *args):
 
 def get_style_links(items, key='pListItem'):
     """Given an iterable of mapping type, return links by key."""
+    import bs4
     return [bs4.BeautifulSoup(item[key], 'lxml').a.get('href') for item in items if key in item.keys()]
 
+def get_category_product(item, key='pListItem'):
+    """Given a category page product mapping, return its link and output fields.
+
+    Only fields whose key is present are returned. Returns None if the
+    product has no link.
+    """
+    if key not in item.keys():
+        return None
+    import bs4
+    product = {field: scalar(item[name]) for field, name in CATEGORY_PRODUCT_FIELDS.items() if name in item}
+    product['link'] = bs4.BeautifulSoup(item[key], 'lxml').a.get('href')
+    return product
+
+def scalar(value):
+    """Reduce price mappings (e.g. {'value': 9.99, 'formattedValue': '$9.99'}) to their value."""
+    if isinstance(value, dict):
+        return value.get('value', value.get('formattedValue'))
+    return value
+
 def get_page_category_code(resp, id='pageCategoryCode'):
     '''Get '''
+    import bs4
     return bs4.BeautifulSoup(resp, 'lxml').find(id=id)['value']
 
 def category_url(category, domain, protocol='https'):
@@ -101,6 +132,7 @@ def remove_whitespace(string):
 
 
 def save_page(address):
+    import requests
     req = requests.get(address)
     file_name = address.split('/')[-1] + '.html'
     with open(file_name, 'w') as f:
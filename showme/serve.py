@@ -0,0 +1,240 @@
+"""Showme, a simple web crawler -- long running crawl service.
+
+``showme serve`` keeps one event loop, HTTP connection pool, throttler and
+response cache warm between crawls, so frequent small crawls don't pay for
+imports, DNS lookups, TLS handshakes and empty caches every time. Crawls are
+started over a local HTTP API or on a schedule, and write CSV files to outdir
+and, if configured, rows to a SQLite store (see showme.store). Output paths
+come only from the config, never from API requests.
+
+    POST   /crawls        start a crawl, JSON body {"urls": [...], "name": ..., "fields": [...]}
+    GET    /crawls        status of recent crawls
+    GET    /crawls/{id}   status of a crawl
+    DELETE /crawls/{id}   cancel a crawl
+
+Settings come from an optional JSON config file, for example::
+
+    {
+        "host": "127.0.0.1",
+        "port": 8351,
+        "transport": "aiohttp",
+        "outdir": "crawls",
+        "store": "showme.db",
+        "schedule": [
+            {"name": "men", "urls": ["https://example.com/c/men"], "every": 3600}
+        ]
+    }
+"""
+
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import os
+import re
+
+from aiohttp import web
+
+import showme.crawling
+import showme.transport
+
+LOGGER = logging.getLogger(__name__)
+
+# Crawl names become part of output file names
+NAME_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]*')
+
+DEFAULT_CONFIG = {
+    'host': '127.0.0.1',
+    'port': 8351,
+    'transport': 'aiohttp',
+    'rate_limit': 10,
+    'cache_ttl': 60.0,
+    'outdir': '.',
+    'store': None,
+    'schedule': [],
+}
+
+
+def load_config(filename=None, **overrides):
+    """Return DEFAULT_CONFIG updated from filename then overrides that aren't None.
+
+    Raises ValueError if a schedule entry is invalid, so mistakes show up at
+    startup rather than when the entry first runs.
+    """
+    config = dict(DEFAULT_CONFIG)
+    if filename:
+        with open(filename, encoding='utf-8') as file:
+            config.update(json.load(file))
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    if not isinstance(config['schedule'], list):
+        raise ValueError('schedule must be a list of entries')
+    for entry in config['schedule']:
+        _check_schedule_entry(entry)
+    return config
+
+
+def _check_schedule_entry(entry):
+    """Raise ValueError unless entry has a non-empty list of urls and a positive every."""
+    if not isinstance(entry, dict):
+        raise ValueError(f'Schedule entries must be objects (got {entry!r})')
+    urls = entry.get('urls')
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+        raise ValueError(f'Schedule entry urls must be a non-empty list of URLs (got {urls!r})')
+    every = entry.get('every')
+    if isinstance(every, bool) or not isinstance(every, (int, float)) or not every > 0:
+        raise ValueError(f'Schedule entry every must be a number of seconds above 0 (got {every!r})')
+    name = entry.get('name', 'scheduled')
+    if not isinstance(name, str) or not NAME_PATTERN.fullmatch(name):
+        raise ValueError(f'Schedule entry name must be letters, digits, _ or - (got {name!r})')
+
+
+class CrawlService:
+    def __init__(self, config, max_history=100, transport=None):
+        self.config = config
+        self.max_history = max_history
+        self.crawls = dict()
+        self.ids = itertools.count(1)
+
+        # Shared by every crawl, created in run (unless a transport is given)
+        # so they belong to the loop
+        self.transport = showme.transport.SharedTransport(transport) if transport is not None else None
+        self.throttler = None
+        self.cache = showme.crawling.ResponseCache(maxsize=4096, ttl=config['cache_ttl'])
+
+    def start_crawl(self, urls, name='crawl', fields=None, store=None):
+        '''Start crawling urls in the background and return the crawl id'''
+        if not isinstance(name, str) or not NAME_PATTERN.fullmatch(name):
+            raise ValueError(f'name must be letters, digits, _ or - (got {name!r})')
+        if self.transport is None:
+            raise RuntimeError('The crawl service is not running')
+
+        os.makedirs(self.config['outdir'], exist_ok=True)
+        crawl_id = next(self.ids)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        crawl = f'{name}_{crawl_id}_{timestamp}'
+        outfile = os.path.join(self.config['outdir'], f'{crawl}.csv')
+        crawler = showme.crawling.Crawler(urls, outfile, store=store or self.config['store'], fields=fields,
+                                          transport=self.transport, throttler=self.throttler, cache=self.cache,
+                                          crawl=crawl)
+        task = asyncio.ensure_future(crawler.crawl())
+        self.crawls[crawl_id] = {'name': name, 'crawler': crawler, 'task': task}
+        LOGGER.info('Started crawl %d (%s): %s', crawl_id, name, ', '.join(urls))
+
+        # Forget the oldest finished crawls
+        finished = [key for key, crawl in self.crawls.items() if crawl['task'].done()]
+        for key in finished[:max(len(self.crawls) - self.max_history, 0)]:
+            del self.crawls[key]
+
+        return crawl_id
+
+    def status(self, crawl_id):
+        crawl = self.crawls[crawl_id]
+        crawler, task = crawl['crawler'], crawl['task']
+        error = None
+        if not task.done():
+            state = 'running'
+        elif task.cancelled():
+            state = 'cancelled'
+        elif task.exception() is not None:
+            state, error = 'failed', repr(task.exception())
+        else:
+            state = 'finished'
+
+        return {
+            'id': crawl_id,
+            'name': crawl['name'],
+            'urls': crawler.urls,
+            'outfile': crawler.filename,
+            'state': state,
+            'total': crawler.product_total,
+            'remaining': crawler.product_remaining,
+            'rate': crawler.rate() if crawler.start_time else 0.0,
+            'crawl': crawler.store.crawl if crawler.store else None,
+            'error': error,
+        }
+
+    async def scheduled(self, entry):
+        '''Re-crawl a schedule entry every entry['every'] seconds'''
+        name = entry.get('name', 'scheduled')
+        crawl_id = None
+        while True:
+            if crawl_id in self.crawls and not self.crawls[crawl_id]['task'].done():
+                LOGGER.warning('Skipping scheduled crawl %s, the last one is still running', name)
+            else:
+                try:
+                    crawl_id = self.start_crawl(entry['urls'], name=name, fields=entry.get('fields'),
+                                                store=entry.get('store'))
+                except Exception as exc:
+                    LOGGER.exception('Scheduled crawl %s failed to start: %r', name, exc)
+            await asyncio.sleep(entry['every'])
+
+    async def post_crawl(self, request):
+        # Requiring JSON stops pages in a local browser posting cross-origin
+        # without a CORS preflight.
+        if request.content_type != 'application/json':
+            raise web.HTTPUnsupportedMediaType(text='Content-Type must be application/json')
+        try:
+            body = await request.json()
+            urls = body['urls']
+            if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+                raise ValueError('urls must be a list of URLs')
+            crawl_id = self.start_crawl(urls, name=body.get('name', 'crawl'), fields=body.get('fields'))
+        except (ValueError, KeyError, TypeError) as exc:
+            raise web.HTTPBadRequest(text=f'Invalid crawl request: {exc!r}')
+        return web.json_response(self.status(crawl_id), status=201)
+
+    async def get_crawls(self, request):
+        return web.json_response([self.status(crawl_id) for crawl_id in self.crawls])
+
+    def _crawl_id(self, request):
+        try:
+            crawl_id = int(request.match_info['id'])
+        except ValueError:
+            raise web.HTTPNotFound()
+        if crawl_id not in self.crawls:
+            raise web.HTTPNotFound()
+        return crawl_id
+
+    async def get_crawl(self, request):
+        return web.json_response(self.status(self._crawl_id(request)))
+
+    async def delete_crawl(self, request):
+        crawl_id = self._crawl_id(request)
+        self.crawls[crawl_id]['task'].cancel()
+        return web.json_response(self.status(crawl_id), status=202)
+
+    def app(self):
+        '''Return the web application serving the API'''
+        app = web.Application()
+        app.add_routes([
+            web.post('/crawls', self.post_crawl),
+            web.get('/crawls', self.get_crawls),
+            web.get('/crawls/{id}', self.get_crawl),
+            web.delete('/crawls/{id}', self.delete_crawl),
+        ])
+        return app
+
+    async def run(self):
+        '''Serve the API and run scheduled crawls until cancelled'''
+        from asyncio_throttle import Throttler
+
+        if self.transport is None:
+            self.transport = showme.transport.SharedTransport(showme.transport.get_transport(self.config['transport']))
+        self.throttler = Throttler(rate_limit=self.config['rate_limit'], period=1)
+
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        await web.TCPSite(runner, self.config['host'], self.config['port']).start()
+        LOGGER.info('Serving on http://%s:%d', self.config['host'], self.config['port'])
+
+        schedules = [asyncio.ensure_future(self.scheduled(entry)) for entry in self.config['schedule']]
+        try:
+            await asyncio.Event().wait()
+        finally:
+            tasks = schedules + [crawl['task'] for crawl in self.crawls.values()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await runner.cleanup()
+            await self.transport.close_shared()
@@ -1,5 +1,6 @@
 import argparse
 import asyncio
+import csv
 import logging
 import pathlib
 import os
@@ -21,23 +22,135 @@ def config_logging(level):
 # @TODO: Rename to build command line arguments
 def _command_line_parser():
     """Command line parser and argument definition"""
-    parser = argparse.ArgumentParser(description="Quickly get product properties")
+    parser = argparse.ArgumentParser(description="Quickly get product properties",
+                                     epilog="Run 'showme query -h' to query a result store "
+                                            "or 'showme serve -h' to run the crawl service")
     parser.add_argument('categories', type=str, nargs='+',
                         help='the category to query (e.g. "men|clearance")')
     # parser.add_argument('-d', '--domain', help='Domain of website', required=True,
     #                     default=os.getenv('SHOWME_DOMAIN'), type=str)
     parser.add_argument('-o', '--outfile', type=str, nargs='?', default=None, required=False,
                         help='CSV output file')
+    parser.add_argument('--fields', type=lambda fields: fields.split(','), default=None,
+                        help='Comma separated output columns (e.g. "style,color,name,price"), '
+                             'columns available on category pages skip product requests')
+    parser.add_argument('--transport', choices=['aiohttp', 'http2'], default='aiohttp',
+                        help='HTTP client, http2 multiplexes requests over one connection '
+                             '(requires showme[http2])')
+    parser.add_argument('--store', type=str, metavar='DATABASE', default=None,
+                        help='Also write results to an indexed SQLite store')
+    archive = parser.add_mutually_exclusive_group()
+    archive.add_argument('--record', type=str, metavar='ARCHIVE', default=None,
+                         help='Record every response to ARCHIVE')
+    archive.add_argument('--replay', type=str, metavar='ARCHIVE', default=None,
+                         help='Serve responses from ARCHIVE instead of the network')
     parser.add_argument('-v', '--verbose', action='count', dest='level', default=0,
                         help='Verbose logging (repeat for more verbose)')
+    parser.add_argument('--profile', type=str, metavar='PREFIX', default=None,
+                        help='Write a per-stage time breakdown to PREFIX.txt and a profile '
+                             'to PREFIX.folded (flamegraph stacks) or PREFIX.prof (cProfile)')
+    parser.add_argument('--profile-mode', choices=['sampling', 'cprofile'], default='sampling',
+                        help='Profiler to run alongside the stage timing (default: sampling)')
+    parser.add_argument('--queue-logging', action='store_true',
+                        help='Write logs from a background thread and sample per-request messages')
     parser.add_argument('-q', '--quiet', action='store_const', const=0, dest='level', default=1,
                         help='Only log errors')
     return parser
 
 
+def _query_command_parser():
+    """Command line parser for the query subcommand"""
+    parser = argparse.ArgumentParser(prog='showme query', description='Query a showme result store')
+    parser.add_argument('store', type=str, help='SQLite store written by showme --store')
+    parser.add_argument('--style', type=str, help='Only rows of this style')
+    parser.add_argument('--color', type=str, help='Only rows of this color code')
+    parser.add_argument('--upc', type=str, help='Only rows with this UPC')
+    parser.add_argument('--sku', type=str, dest='productSKUCode', help='Only rows with this SKU code')
+    parser.add_argument('--category', type=str, help='Only rows from this category code (e.g. "main|men")')
+    parser.add_argument('--crawl', type=str, help='Only rows from this crawl')
+    parser.add_argument('--on-sale', action='store_true', help='Only rows with a sale price')
+    parser.add_argument('-o', '--outfile', type=str, default=None,
+                        help='CSV output file (default: stdout)')
+    return parser
+
+
+def _query_command(argv):
+    """Query a result store and write matching rows as CSV"""
+    import showme.store as store
+
+    parser = _query_command_parser()
+    args = parser.parse_args(argv)
+    criteria = {field: getattr(args, field) for field in ('style', 'color', 'upc', 'productSKUCode', 'category', 'crawl')}
+    rows = store.query(args.store, on_sale=args.on_sale, **criteria)
+    try:
+        first = next(rows, None)
+    except store.StoreError as exc:
+        parser.error(str(exc))
+    if first is None:
+        print('No matching rows', file=sys.stderr)
+        return
+
+    outfile = open(args.outfile, 'w', newline='') if args.outfile else sys.stdout
+    try:
+        csvwriter = csv.DictWriter(outfile, fieldnames=list(first.keys()), lineterminator=os.linesep)
+        csvwriter.writeheader()
+        csvwriter.writerow(first)
+        csvwriter.writerows(rows)
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+def _serve_command_parser():
+    """Command line parser for the serve subcommand"""
+    parser = argparse.ArgumentParser(prog='showme serve',
+                                     description='Run showme as a service with warm connections and caches')
+    parser.add_argument('-c', '--config', type=str, default=None,
+                        help='JSON config file (settings and scheduled crawls, see showme.serve)')
+    parser.add_argument('--host', type=str, default=None, help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=None, help='Port to listen on (default: 8351)')
+    parser.add_argument('--transport', choices=['aiohttp', 'http2'], default=None,
+                        help='HTTP client (default: aiohttp)')
+    parser.add_argument('--outdir', type=str, default=None, help='Directory for CSV output (default: .)')
+    parser.add_argument('--store', type=str, metavar='DATABASE', default=None,
+                        help='Also write results to an indexed SQLite store')
+    parser.add_argument('-v', '--verbose', action='count', dest='level', default=2,
+                        help='Verbose logging (repeat for more verbose)')
+    parser.add_argument('-q', '--quiet', action='store_const', const=0, dest='level',
+                        help='Only log errors')
+    return parser
+
+
+def _serve_command(argv):
+    """Run the crawl service until interrupted"""
+    import showme.serve as serve
+    import showme.transport as transport
+
+    parser = _serve_command_parser()
+    args = parser.parse_args(argv)
+    log_levels = [logging.ERROR, logging.WARN, logging.INFO, logging.DEBUG]
+    config_logging(level=log_levels[min(args.level, len(log_levels) - 1)])
+
+    try:
+        config = serve.load_config(args.config, host=args.host, port=args.port, transport=args.transport,
+                                   outdir=args.outdir, store=args.store)
+        transport.get_transport(config['transport'])
+    except (OSError, ImportError, ValueError) as exc:
+        parser.error(str(exc))
+    try:
+        asyncio.run(serve.CrawlService(config).run())
+    except KeyboardInterrupt:
+        LOGGER.info('Service stopped')
+
+
 # @TODO: Rename to main?
 def _command_line():
     """Call the command line parser and process arguments"""
+    if sys.argv[1:2] == ['query']:
+        return _query_command(sys.argv[2:])
+    if sys.argv[1:2] == ['serve']:
+        return _serve_command(sys.argv[2:])
+
     parser = _command_line_parser()
     args = parser.parse_args()
 
@@ -45,6 +158,12 @@ def _command_line():
     log_level = log_levels[min(args.level, len(log_levels) - 1)]
     config_logging(level=log_level)
 
+    listener = None
+    if args.queue_logging:
+        import showme.logs as logs
+        listener = logs.start_queue_logging()
+        logs.rate_limit('showme.crawling')
+
     # if not args.categories:
     #     print('No categories specified.')
     #     print('Use --help for command line help')
@@ -55,27 +174,52 @@ def _command_line():
     #     print('Use --help for command line help')
     #     return
 
+    import showme.crawling as crawling
+
+    unknown = [field for field in args.fields or [] if field not in crawling.FIELDS]
+    if unknown:
+        parser.error(f'unknown fields {", ".join(unknown)} (choose from {", ".join(crawling.FIELDS)})')
+
     loop = asyncio.get_event_loop()
-    loop.set_debug(True)
+    # Debug mode's slow callback checks and origin tracking would skew the profile
+    loop.set_debug(not args.profile)
 
     import signal
 
-    crawler = crawling.Crawler(args.categories, outfile=args.outfile)
+    profiler = None
+    if args.profile:
+        import showme.profiling as profiling
+        profiler = profiling.Profiler()
+
+    try:
+        crawler = crawling.Crawler(args.categories, outfile=args.outfile, record=args.record,
+                                   replay=args.replay, store=args.store, fields=args.fields,
+                                   transport=args.transport, profiler=profiler)
+    except ImportError as exc:
+        parser.error(str(exc))
 
     # Python 3.7 on Windows does not support signals, supposedly 3.8 will.
     try:
-        loop.run_until_complete(crawler.run())
+        if profiler is not None:
+            profiler.start(args.profile_mode)
+        loop.run_until_complete(crawler.crawl())
     except KeyboardInterrupt:
         sys.stderr.flush()
         print('\nProcess Interrupted\n')
         LOGGER.info('Process interrupted')
     finally:
+        if profiler is not None:
+            profiler.stop()
+            print(profiler.report(), file=sys.stderr)
+            LOGGER.info('Profile written to %s', ', '.join(profiler.write(args.profile)))
         LOGGER.info("That's All Folks!")
         # Sleep for aiohttp workaround https://github.com/aio-libs/aiohttp/issues/1925
         loop.run_until_complete(asyncio.sleep(0.250))
         # reporting.report(crawler)
         # loop.stop()
         loop.close()
+        if listener is not None:
+            listener.stop()
 
 if __name__ == '__main__':
     _command_line()
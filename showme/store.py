@@ -0,0 +1,126 @@
+"""Showme, a simple web crawler -- indexed store of crawl results.
+
+Rows from every crawl are appended to a single SQLite table so questions like
+"all SKUs of style X" or "everything on sale in category Y" are index lookups
+instead of scans over many CSV files.
+"""
+
+import datetime
+import logging
+import pathlib
+import sqlite3
+
+LOGGER = logging.getLogger(__name__)
+
+TABLE = 'products'
+INDEXED_FIELDS = ['style', 'color', 'upc', 'productSKUCode', 'category', 'crawl']
+
+
+class StoreError(Exception):
+    """Store does not exist or was not written by showme."""
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def connect(filename, readonly=False):
+    if readonly:
+        # Read-only so querying a mistyped path doesn't create an empty store
+        uri = pathlib.Path(filename).resolve().as_uri() + '?mode=ro'
+        connection = sqlite3.connect(uri, uri=True)
+    else:
+        connection = sqlite3.connect(str(filename))
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+class SQLiteScribe:
+    '''Append crawl rows to the indexed products table
+
+    Each row is tagged with crawl, an identifier for the run (the start time
+    by default). Rows are inserted in batches, call close to write the rest.
+    '''
+    def __init__(self, filename, fields, crawl=None, batch_size=500):
+        self.filename = str(filename)
+        self.fields = list(fields) + [field for field in ('category', 'crawl') if field not in fields]
+        self.crawl = crawl or datetime.datetime.now().isoformat(timespec='seconds')
+        self.batch_size = batch_size
+        self.pending = []
+
+        self.connection = connect(self.filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self._create_table()
+
+        columns = ', '.join(quote(field) for field in self.fields)
+        placeholders = ', '.join('?' for _ in self.fields)
+        self.insert = f'INSERT INTO {TABLE} ({columns}) VALUES ({placeholders})'
+
+    def _create_table(self):
+        with self.connection:
+            columns = ', '.join(quote(field) for field in self.fields)
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} ({columns})')
+
+            # Stores written with other fields gain the missing columns
+            existing = {row['name'] for row in self.connection.execute(f'PRAGMA table_info({TABLE})')}
+            for field in self.fields:
+                if field not in existing:
+                    self.connection.execute(f'ALTER TABLE {TABLE} ADD COLUMN {quote(field)}')
+
+            for field in INDEXED_FIELDS:
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {quote(TABLE + "_" + field)} ON {TABLE} ({quote(field)})')
+
+    def __call__(self, row):
+        row = {**row, 'crawl': self.crawl}
+        self.pending.append(tuple(sqlite_value(row.get(field)) for field in self.fields))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(self.insert, self.pending)
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def sqlite_value(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def query(filename, on_sale=False, **criteria):
+    '''Yield rows of the products table matching all criteria as dicts
+
+    Criteria are column names and the value they must equal, criteria that
+    are None are ignored. on_sale selects rows with a sale price. Rows are
+    read from the cursor as they are consumed. Raises StoreError if filename
+    is not a showme store.
+    '''
+    clauses, parameters = [], []
+    for field, value in criteria.items():
+        if value is not None:
+            clauses.append(f'{quote(field)} = ?')
+            parameters.append(value)
+    if on_sale:
+        clauses.append("sale_price IS NOT NULL AND sale_price != ''")
+
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+    try:
+        connection = connect(filename, readonly=True)
+    except sqlite3.Error as exc:
+        raise StoreError(f'Cannot read store {filename}: {exc}') from exc
+    try:
+        try:
+            cursor = connection.execute(f'SELECT * FROM {TABLE}{where}', parameters)
+        except sqlite3.Error as exc:
+            raise StoreError(f'Cannot read store {filename}: {exc}') from exc
+        for row in cursor:
+            yield dict(row)
+    finally:
+        connection.close()
@@ -0,0 +1,107 @@
+"""Showme, a simple web crawler -- HTTP transports used by Crawler.fetch.
+
+A transport has two coroutines: get(url), returning a Response, and close().
+Client sessions are created on first use so they belong to the running loop.
+"""
+
+import logging
+from collections import namedtuple
+
+LOGGER = logging.getLogger(__name__)
+
+# headers is a list of (name, value) pairs
+Response = namedtuple('Response', ['url', 'status', 'headers', 'body'])
+
+# Connection limit and total request timeout in seconds (aiohttp's defaults),
+# every transport uses the same so they are interchangeable.
+CONNECTION_LIMIT = 100
+TIMEOUT = 300.0
+
+
+class AiohttpTransport:
+    '''HTTP/1.1 transport using aiohttp, one connection per concurrent request'''
+    def __init__(self):
+        self.session = None
+
+    async def get(self, url):
+        if self.session is None:
+            import aiohttp
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONNECTION_LIMIT),
+                                                 timeout=aiohttp.ClientTimeout(total=TIMEOUT))
+
+        async with self.session.get(url) as response:
+            body = await response.read()
+            return Response(url, response.status, list(response.headers.items()), body)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class HttpxTransport:
+    '''HTTP/2 transport using httpx, concurrent requests share one connection
+
+    Requires httpx with HTTP/2 support (pip install showme[http2]). Servers
+    that don't negotiate HTTP/2 are spoken to over HTTP/1.1, unless http1 is
+    False in which case plain http:// URLs use HTTP/2 with prior knowledge.
+    '''
+    def __init__(self, http2=True, http1=True):
+        # Fail when the transport is created rather than in every fetch
+        try:
+            import httpx
+            if http2:
+                import h2  # noqa: F401
+        except ImportError as exc:
+            raise ImportError(f'The http2 transport requires httpx[http2] (pip install showme[http2]): {exc}') from exc
+
+        self.http2 = http2
+        self.http1 = http1
+        self.client = None
+
+    async def get(self, url):
+        if self.client is None:
+            import httpx
+            self.client = httpx.AsyncClient(http1=self.http1, http2=self.http2, follow_redirects=True,
+                                            timeout=httpx.Timeout(TIMEOUT),
+                                            limits=httpx.Limits(max_connections=CONNECTION_LIMIT))
+
+        response = await self.client.get(url)
+        return Response(url, response.status_code, list(response.headers.items()), response.content)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+class SharedTransport:
+    '''Transport shared by several crawls, close leaves it open
+
+    Call close_shared once every crawl using it has finished.
+    '''
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def get(self, url):
+        return await self.transport.get(url)
+
+    async def close(self):
+        pass
+
+    async def close_shared(self):
+        await self.transport.close()
+
+
+TRANSPORTS = {
+    'aiohttp': AiohttpTransport,
+    'http2': HttpxTransport,
+}
+
+
+def get_transport(name):
+    """Return a new transport given its name in TRANSPORTS."""
+    try:
+        return TRANSPORTS[name]()
+    except KeyError:
+        raise ValueError(f'Unknown transport {name!r} (choose from {", ".join(TRANSPORTS)})') from None
@@ -1,13 +1,12 @@
-import asyncio
+import concurrent.futures
 import datetime
 import logging
 import logging.config
-import time
-import threading
 import tkinter as tk
 import tkinter.ttk as ttk
 import sys
 import showme.crawling
+import showme.logs
 
 LOGGER = logging.getLogger(__name__)
 
@@ -15,8 +14,10 @@ class Application(tk.Frame):
     def __init__(self, master=None, version=None):
         super().__init__(master)
         self.version = version
-        self.thread = None
-        self.running = None
+        self.loop = showme.crawling.BackgroundLoop()
+        self.events = showme.crawling.ProgressChannel(notify=self.notify)
+        self.crawls = dict()
+        self.status = dict()
         self.setup()
 
     def setup(self):
@@ -24,6 +25,8 @@ class Application(tk.Frame):
         self.master.columnconfigure(0, weight=1, minsize=500)
         self.master.rowconfigure(0, weight=1, minsize=50)
         self.master.title(f'Showme - a web crawler (v{self.version})')
+        self.master.bind('<<CrawlProgress>>', self.on_progress)
+        self.master.protocol('WM_DELETE_WINDOW', self.cmd_quit)
 
         self.lfrm = tk.LabelFrame(
             text='Crawl category URL',
@@ -34,6 +37,7 @@ class Application(tk.Frame):
         self.lfrm.grid(padx=5, pady=5, sticky='nsew')
         self.lfrm.columnconfigure(0, weight=10)
         self.lfrm.columnconfigure(1, weight=1)
+        self.lfrm.columnconfigure(2, weight=1)
 
         self.ent_url = tk.Entry(master=self.lfrm)
         self.ent_url.grid(row=0, column=0, sticky='nswe')
@@ -43,34 +47,71 @@ class Application(tk.Frame):
         self.btn_go["command"] = self.cmd_go
         self.btn_go.grid(row=0, column=1, sticky='nswe')
 
+        self.btn_cancel = tk.Button(master=self.lfrm)
+        self.btn_cancel["text"] = "Cancel"
+        self.btn_cancel["command"] = self.cmd_cancel
+        self.btn_cancel["state"] = "disabled"
+        self.btn_cancel.grid(row=0, column=2, sticky='nswe')
+
         self.progress = ttk.Progressbar(master=self.lfrm, orient = tk.HORIZONTAL, value=0)
-        self.progress.step(0)
         self.progress.config(mode='determinate')
-        self.progress.grid(row=1, column=0, columnspan=2, sticky='nswe')
-
-    def poll_thread(self):
-        """
-        Check every 200 ms if there is something new in the queue.
-        """
-        LOGGER.info('GUI poll threading Heartbeat')
-        if self.running:
-            if self.thread.is_alive():
-                self.progress.step(amount=5.0)
-                self.master.after(200, self.poll_thread)
+        self.progress.grid(row=1, column=0, columnspan=3, sticky='nswe')
+
+        self.lbl_status = tk.Label(master=self.lfrm, text='Idle', anchor='w')
+        self.lbl_status.grid(row=2, column=0, columnspan=3, sticky='nswe')
+
+    def notify(self):
+        """Wake the Tk main loop, called from the crawler thread."""
+        try:
+            self.master.event_generate('<<CrawlProgress>>', when='tail')
+        except (RuntimeError, tk.TclError):
+            # Main loop has gone away, nothing left to update
+            pass
+
+    def on_progress(self, event=None):
+        """Apply crawler progress events to the progress bar."""
+        for progress in self.events.drain():
+            if progress.kind == 'error':
+                LOGGER.error('%s: %s', progress.source, progress.error)
+            if progress.kind == 'finished':
+                self.crawls.pop(progress.source, None)
+                self.status.pop(progress.source, None)
             else:
-                LOGGER.info('Threaded stoped')
-                self.running = False
-                self.btn_go['state'] = 'normal'
-                self.progress.stop()
+                self.status[progress.source] = progress
+
+        total = sum(progress.total for progress in self.status.values())
+        remaining = sum(progress.remaining for progress in self.status.values())
+        rate = sum(progress.rate for progress in self.status.values())
 
+        if self.crawls:
+            self.progress.config(maximum=max(total, 1), value=total - remaining)
+            self.lbl_status['text'] = f'{len(self.crawls)} running, {total - remaining} of {total} products ({rate:.1f}/s)'
+            self.btn_cancel['state'] = 'normal'
+        else:
+            self.progress.config(value=0)
+            self.lbl_status['text'] = 'Idle'
+            self.btn_cancel['state'] = 'disabled'
 
     def cmd_go(self):
-        self.btn_go["state"] = "disabled"
-        # self.progress.start()
-        self.running = 1
-        self.thread = threading.Thread(target=run_showme, args=[str(self.ent_url.get())])
-        self.thread.start()
-        self.poll_thread()
+        outfile = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S") + '.csv'
+        while outfile in self.crawls:
+            outfile = outfile.replace('.csv', '_.csv')
+        crawler = showme.crawling.Crawler([str(self.ent_url.get())], outfile, progress=self.events)
+        self.crawls[outfile] = self.loop.submit(crawler.crawl())
+        self.on_progress()
+
+    def cmd_cancel(self):
+        for future in self.crawls.values():
+            future.cancel()
+
+    def cmd_quit(self):
+        # Stop notifying first, event_generate would block on this (waiting) thread
+        self.events.notify = None
+        self.cmd_cancel()
+        # Let the cancelled crawls close their sessions before stopping the loop
+        concurrent.futures.wait(self.crawls.values(), timeout=5.0)
+        self.loop.stop(timeout=1.0)
+        self.master.destroy()
 
 def config_logging(level):
     logging.basicConfig(
@@ -80,18 +121,6 @@ def config_logging(level):
         stream=sys.stderr,
     )
 
-def run_showme(user_url):
-    start_time = time.time()
-    timestamp = str(datetime.datetime.fromtimestamp(start_time).strftime("%Y-%m-%d_%H%M%S"))
-
-    try:
-        crawler = showme.crawling.Crawler([user_url], timestamp+'.csv')
-        asyncio.run(crawler.crawl(), debug=False)
-    finally:
-        stop_time = time.time()
-        duration = stop_time - start_time
-        LOGGER.info(f'Finished in {duration:.3} seconds')
-
 LOGGING_CONFIG = { 
     'version': 1,
     'disable_existing_loggers': False,
@@ -127,5 +156,11 @@ LOGGING_CONFIG = {
 if __name__ == '__main__':
     logging.config.dictConfig(LOGGING_CONFIG)
     # config_logging(level=logging.DEBUG)
-    app = Application(tk.Tk(), version=showme.__version__)
-    app.mainloop()
\ No newline at end of file
+    # Keep the DEBUG stdout and file writes off the crawler thread
+    listener = showme.logs.start_queue_logging()
+    showme.logs.rate_limit('showme.crawling')
+    try:
+        app = Application(tk.Tk(), version=showme.__version__)
+        app.mainloop()
+    finally:
+        listener.stop()
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""Test doubles shared by the tests."""
+
+import asyncio
+import collections
+import json
+import urllib.parse
+
+from showme.transport import Response
+
+
+class StubTransport:
+    '''Transport answering from a mapping of URL path to page
+
+    Pages are HTML strings or JSON-serialisable objects. Requests are counted
+    by URL in requests, and get waits for delay seconds before answering.
+    '''
+    def __init__(self, pages, delay=0.0):
+        self.pages = pages
+        self.delay = delay
+        self.requests = collections.Counter()
+        self.closed = False
+
+    async def get(self, url):
+        self.requests[url] += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        page = self.pages[urllib.parse.urlsplit(url).path]
+        body = page.encode('utf-8') if isinstance(page, str) else json.dumps(page).encode('utf-8')
+        return Response(url, 200, [], body)
+
+    async def close(self):
+        self.closed = True
+
+
+def category_product(code, **keys):
+    '''Category page product linking to code, with any extra keys'''
+    return {'pListItem': f'<div><a href="/en/Title/p/{code}">x</a></div>', **keys}
+
+
+def storefront(products, feeds=None, details=None):
+    '''Pages for a one page category of products, plus product feeds and details'''
+    pages = {
+        '/cat': '<html><input id="pageCategoryCode" value="main|men"/></html>',
+        '/**/c/main|men/getCategoryPageData': {
+            'pagination': {'currentPage': 0, 'numberOfPages': 1, 'totalNumberOfResults': len(products)},
+            'products': products,
+        },
+    }
+    for code, feed in (feeds or {}).items():
+        pages[f'/en/p/{code}/detailSummary/getProductFeed2.json'] = feed
+    for code, detail in (details or {}).items():
+        pages[f'/p/{code}/getProductDetail.json'] = detail
+    return pages
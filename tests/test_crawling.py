@@ -0,0 +1,129 @@
+"""Crawler behaviour against a stub transport."""
+
+import asyncio
+import csv
+import logging
+
+import pytest
+
+import showme.crawling
+from stubs import StubTransport, category_product, storefront
+
+# Category page products are assumed to carry the same camelCase keys as the
+# product feed (see showme.scraping.CATEGORY_PRODUCT_FIELDS), prices may be
+# {'value', 'formattedValue'} mappings.
+CATEGORY_PRODUCTS = [
+    category_product('STY1-RED', name='Shirt', price={'value': 10.0, 'formattedValue': '$10.00'},
+                     listPrice={'value': 12.0}, salePrice={'value': 10.0}),
+    category_product('STY2-BLU', name='Pants', price={'value': 20.0, 'formattedValue': '$20.00'},
+                     listPrice={'value': 20.0}, salePrice=None),
+]
+
+FEEDS = {
+    'STY1-RED': [{'productCode': 'STY1-RED', 'colorName': 'Red', 'price': 10.0,
+                  'sizes': [{'productSKUCode': 'STY1-RED-S'}]}],
+    'STY2-BLU': [{'productCode': 'STY2-BLU', 'colorName': 'Blue', 'price': 20.0,
+                  'sizes': [{'productSKUCode': 'STY2-BLU-S'}]}],
+}
+DETAILS = {'STY1-RED': {'name': 'Shirt'}, 'STY2-BLU': {'name': 'Pants'}}
+
+
+def crawl(tmp_path, pages, **kwargs):
+    transport = StubTransport(pages)
+    outfile = tmp_path / 'out.csv'
+    crawler = showme.crawling.Crawler(['http://shop.test/cat'], outfile, transport=transport, **kwargs)
+    asyncio.run(crawler.crawl())
+    with open(outfile, newline='') as file:
+        return crawler, transport, list(csv.DictReader(file))
+
+
+def product_requests(transport):
+    return [url for url in transport.requests if '/p/' in url]
+
+
+def test_light_crawl_uses_category_data(tmp_path):
+    pages = storefront(CATEGORY_PRODUCTS, FEEDS, DETAILS)
+    crawler, transport, rows = crawl(tmp_path, pages, fields=['style', 'color', 'name', 'price', 'sale_price'])
+
+    assert rows == [
+        {'style': 'STY1', 'color': 'RED', 'name': 'Shirt', 'price': '10.0', 'sale_price': '10.0'},
+        {'style': 'STY2', 'color': 'BLU', 'name': 'Pants', 'price': '20.0', 'sale_price': ''},
+    ]
+    assert product_requests(transport) == []
+    assert crawler.product_remaining == 0
+
+
+def test_light_crawl_falls_back_to_product_pages(tmp_path, caplog):
+    products = [category_product('STY1-RED'), category_product('STY2-BLU')]
+    pages = storefront(products, FEEDS, DETAILS)
+    with caplog.at_level(logging.WARNING, logger='showme.crawling'):
+        crawler, transport, rows = crawl(tmp_path, pages, fields=['style', 'name', 'price'])
+
+    assert sorted(rows, key=lambda row: row['style']) == [
+        {'style': 'STY1', 'name': 'Shirt', 'price': '10.0'},
+        {'style': 'STY2', 'name': 'Pants', 'price': '20.0'},
+    ]
+    assert len(product_requests(transport)) == 4
+    assert crawler.product_remaining == 0
+    assert [record.message for record in caplog.records if 'Category page data has no' in record.message] == [
+        'Category page data has no name, price, requesting product pages instead'
+    ]
+
+
+def fetcher(tmp_path, pages, delay=0.0, cache=None):
+    transport = StubTransport(pages, delay)
+    crawler = showme.crawling.Crawler([], tmp_path / 'out.csv', transport=transport, cache=cache)
+    return crawler, transport
+
+
+def test_concurrent_fetches_share_one_request(tmp_path):
+    crawler, transport = fetcher(tmp_path, {'/data': {'a': 1}}, delay=0.01)
+
+    async def main():
+        return await asyncio.gather(
+            crawler.fetch(showme.crawling.Job('http://shop.test/data?x=1&y=2', json=True)),
+            crawler.fetch(showme.crawling.Job('http://SHOP.test/data?y=2&x=1', json=True)),
+        )
+
+    assert asyncio.run(main()) == [{'a': 1}, {'a': 1}]
+    assert sum(transport.requests.values()) == 1
+    assert crawler.inflight == {}
+
+
+def test_cancelled_waiter_does_not_cancel_others(tmp_path):
+    crawler, transport = fetcher(tmp_path, {'/data': {'a': 1}}, delay=0.01)
+
+    async def main():
+        first = asyncio.ensure_future(crawler.fetch(showme.crawling.Job('http://shop.test/data', json=True)))
+        second = asyncio.ensure_future(crawler.fetch(showme.crawling.Job('http://shop.test/data', json=True)))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = asyncio.run(main())
+    assert isinstance(first, asyncio.CancelledError)
+    assert second == {'a': 1}
+    assert sum(transport.requests.values()) == 1
+
+
+def test_expired_response_is_fetched_again(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(showme.crawling.time, 'monotonic', lambda: now[0])
+    crawler, transport = fetcher(tmp_path, {'/data': {'a': 1}}, cache=showme.crawling.ResponseCache(ttl=60.0))
+
+    async def fetch():
+        return await crawler.fetch(showme.crawling.Job('http://shop.test/data', json=True))
+
+    asyncio.run(fetch())
+    now[0] += 30.0
+    asyncio.run(fetch())
+    assert sum(transport.requests.values()) == 1
+
+    now[0] += 31.0
+    assert asyncio.run(fetch()) == {'a': 1}
+    assert sum(transport.requests.values()) == 2
+
+
+def test_requires_transport(tmp_path):
+    with pytest.raises(ValueError):
+        showme.crawling.Crawler([], tmp_path / 'out.csv', transport=None)
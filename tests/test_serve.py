@@ -0,0 +1,80 @@
+"""Crawl service API checks, no crawls reach the network."""
+
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import showme.serve
+from stubs import StubTransport, category_product, storefront
+
+
+def request(tmp_path, method, path, **kwargs):
+    '''Make one API request, return (status, body text, service)
+
+    Crawls started by the request fetch from a stub storefront and are
+    cancelled afterwards, any other error they raised fails the test.
+    '''
+    config = showme.serve.load_config(outdir=str(tmp_path / 'out'), store=str(tmp_path / 'showme.db'))
+    transport = StubTransport(storefront([category_product('STY1-RED')]), delay=0.1)
+    service = showme.serve.CrawlService(config, transport=transport)
+
+    async def go():
+        async with TestClient(TestServer(service.app())) as client:
+            response = await client.request(method, path, **kwargs)
+            text = await response.text()
+        tasks = [crawl['task'] for crawl in service.crawls.values()]
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert [result for result in results if not isinstance(result, (asyncio.CancelledError, type(None)))] == []
+        return response.status, text
+
+    status, text = asyncio.run(go())
+    return status, text, service
+
+
+def test_requires_json(tmp_path):
+    status, _, service = request(tmp_path, 'POST', '/crawls', data='{"urls": ["http://shop.test/cat"]}',
+                                 headers={'Content-Type': 'text/plain'})
+    assert status == 415
+    assert not service.crawls
+
+
+def test_rejects_path_in_name(tmp_path):
+    status, _, service = request(tmp_path, 'POST', '/crawls',
+                                 json={'urls': ['http://shop.test/cat'], 'name': '../escaped'})
+    assert status == 400
+    assert not service.crawls
+    assert not list(tmp_path.glob('**/*escaped*'))
+
+
+def test_ignores_store_in_request(tmp_path):
+    status, _, service = request(tmp_path, 'POST', '/crawls',
+                                 json={'urls': ['http://shop.test/cat'], 'store': str(tmp_path / 'anywhere.db')})
+    assert status == 201
+    assert not (tmp_path / 'anywhere.db').exists()
+    crawler = service.crawls[1]['crawler']
+    assert crawler.store.filename == str(tmp_path / 'showme.db')
+    assert crawler.store.crawl.startswith('crawl_1_')
+
+
+def test_start_crawl_requires_running_service(tmp_path):
+    service = showme.serve.CrawlService(showme.serve.load_config(outdir=str(tmp_path)))
+    with pytest.raises(RuntimeError):
+        service.start_crawl(['http://shop.test/cat'])
+    assert not service.crawls
+
+
+@pytest.mark.parametrize('entry', [
+    {'every': 60},
+    {'urls': [], 'every': 60},
+    {'urls': 'http://shop.test/cat', 'every': 60},
+    {'urls': ['http://shop.test/cat']},
+    {'urls': ['http://shop.test/cat'], 'every': 0},
+    {'urls': ['http://shop.test/cat'], 'every': '60'},
+    {'urls': ['http://shop.test/cat'], 'every': 60, 'name': '../escaped'},
+])
+def test_rejects_invalid_schedule(entry):
+    with pytest.raises(ValueError):
+        showme.serve.load_config(schedule=[entry])
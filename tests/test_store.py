@@ -0,0 +1,28 @@
+"""Write rows to a SQLite store and query them back."""
+
+import pytest
+
+import showme.crawling
+import showme.store
+
+
+def test_query(tmp_path):
+    filename = tmp_path / 'showme.db'
+    scribe = showme.store.SQLiteScribe(filename, showme.crawling.FIELDS, crawl='first')
+    scribe({'style': 'STY1', 'color': 'RED', 'productSKUCode': 'STY1-RED-S', 'sale_price': 10, 'category': 'main|men'})
+    scribe({'style': 'STY2', 'color': 'RED', 'productSKUCode': 'STY2-RED-S', 'sale_price': None, 'category': 'main|men'})
+    scribe.close()
+
+    rows = list(showme.store.query(filename, style='STY1'))
+    assert [row['productSKUCode'] for row in rows] == ['STY1-RED-S']
+    assert rows[0]['crawl'] == 'first'
+
+    rows = list(showme.store.query(filename, on_sale=True, category='main|men'))
+    assert [row['style'] for row in rows] == ['STY1']
+
+
+def test_query_missing_store(tmp_path):
+    filename = tmp_path / 'missing.db'
+    with pytest.raises(showme.store.StoreError):
+        list(showme.store.query(filename, style='STY1'))
+    assert not filename.exists()
@@ -0,0 +1,170 @@
+"""Crawl a local storefront with every transport in showme.transport.TRANSPORTS.
+
+The storefront is a plain http:// aiohttp server, so the http2 transport
+talks HTTP/1.1 to it; test_http2_multiplexes covers HTTP/2 itself against
+an HTTP/2-only server.
+"""
+
+import asyncio
+import collections
+import csv
+import json
+import urllib.parse
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import showme.crawling
+import showme.transport
+
+# Four products in three styles, each colour comes in two sizes
+PRODUCTS = ['STY1-RED', 'STY1-BLU', 'STY2-RED', 'STY3-RED']
+COLORS = {'STY1': ['RED', 'BLU'], 'STY2': ['RED'], 'STY3': ['RED']}
+
+
+def storefront(hits):
+    async def handle(request):
+        path = request.path
+        hits[path] += 1
+        if path == '/c/men':
+            raise web.HTTPFound('/cat')
+        if path == '/cat':
+            return web.Response(text='<html><input id="pageCategoryCode" value="main|men"/></html>',
+                                content_type='text/html')
+        if path.endswith('/getCategoryPageData'):
+            return web.json_response({
+                'pagination': {'currentPage': 0, 'numberOfPages': 1, 'totalNumberOfResults': len(PRODUCTS)},
+                'products': [{'pListItem': f'<div><a href="/en/Title/p/{code}">x</a></div>'} for code in PRODUCTS],
+            })
+        if path.endswith('/getProductFeed2.json'):
+            style = path.split('/')[3].split('-')[0]
+            return web.json_response([{
+                'productCode': f'{style}-{color}',
+                'colorName': color,
+                'price': 10,
+                'listPrice': 12,
+                'salePrice': None,
+                'sizes': [{'productSKUCode': f'{style}-{color}-{size}', 'upc': f'{style}{color}{size}'}
+                          for size in ('S', 'M')],
+            } for color in COLORS[style]])
+        if path.endswith('/getProductDetail.json'):
+            return web.json_response({'name': 'Product ' + path.split('/')[2]})
+        raise web.HTTPNotFound()
+
+    app = web.Application()
+    app.router.add_route('GET', '/{tail:.*}', handle)
+    return app
+
+
+async def crawl(transport, outfile):
+    hits = collections.Counter()
+    server = TestServer(storefront(hits))
+    await server.start_server()
+    try:
+        crawler = showme.crawling.Crawler([str(server.make_url('/c/men'))], outfile, transport=transport)
+        await crawler.crawl()
+    finally:
+        await server.close()
+    return crawler, hits
+
+
+def run_crawl(name, tmp_path):
+    try:
+        transport = showme.transport.get_transport(name)
+    except ImportError as exc:
+        pytest.skip(str(exc))
+
+    outfile = tmp_path / f'{name}.csv'
+    crawler, hits = asyncio.run(crawl(transport, str(outfile)))
+    with open(outfile, newline='') as file:
+        rows = list(csv.DictReader(file))
+
+    # The server port differs between runs, compare URL paths only
+    for row in rows:
+        row['url'] = urllib.parse.urlsplit(row['url']).path
+    return crawler, sorted(rows, key=lambda row: row['productSKUCode']), hits
+
+
+@pytest.mark.parametrize('name', sorted(showme.transport.TRANSPORTS))
+def test_crawl(name, tmp_path):
+    crawler, rows, hits = run_crawl(name, tmp_path)
+
+    assert [row['productSKUCode'] for row in rows] == [
+        'STY1-BLU-M', 'STY1-BLU-S', 'STY1-RED-M', 'STY1-RED-S',
+        'STY2-RED-M', 'STY2-RED-S', 'STY3-RED-M', 'STY3-RED-S',
+    ]
+    assert rows[0]['name'] == 'Product STY1-RED'
+    assert rows[0]['url'] == '/en/p/STY1-BLU'
+
+    # The redirect is followed and each style's feed and detail fetched once
+    assert hits['/c/men'] == 1
+    assert hits['/cat'] == 1
+    assert sum(hits.values()) == 9
+
+    assert crawler.product_total == len(PRODUCTS)
+    assert crawler.product_remaining == 0
+
+
+def test_transports_agree(tmp_path):
+    results = dict()
+    for name in sorted(showme.transport.TRANSPORTS):
+        try:
+            showme.transport.get_transport(name)
+        except ImportError:
+            continue
+        _, rows, hits = run_crawl(name, tmp_path)
+        results[name] = (rows, hits)
+
+    if len(results) < 2:
+        pytest.skip('Only one transport is installed')
+
+    (first_rows, first_hits), *others = results.values()
+    for rows, hits in others:
+        assert rows == first_rows
+        assert hits == first_hits
+
+
+async def serve_http2(requests, reader, writer):
+    """Answer every request on an HTTP/2 prior-knowledge connection with its path"""
+    import h2.config
+    import h2.connection
+    import h2.events
+
+    connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+    connection.initiate_connection()
+    writer.write(connection.data_to_send())
+    requests[writer] = 0
+    while data := await reader.read(65535):
+        for event in connection.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                requests[writer] += 1
+                body = json.dumps(dict(event.headers)[b':path'].decode()).encode()
+                connection.send_headers(event.stream_id, [(':status', '200'), ('content-length', str(len(body)))])
+                connection.send_data(event.stream_id, body, end_stream=True)
+        writer.write(connection.data_to_send())
+        await writer.drain()
+    writer.close()
+
+
+def test_http2_multiplexes():
+    try:
+        transport = showme.transport.HttpxTransport(http1=False)
+    except ImportError as exc:
+        pytest.skip(str(exc))
+    requests = dict()
+
+    async def main():
+        server = await asyncio.start_server(lambda *stream: serve_http2(requests, *stream), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await asyncio.gather(*(transport.get(f'http://127.0.0.1:{port}/p/{n}') for n in range(5)))
+        finally:
+            await transport.close()
+            server.close()
+            await server.wait_closed()
+
+    responses = asyncio.run(main())
+    assert [json.loads(response.body) for response in responses] == [f'/p/{n}' for n in range(5)]
+    # The server only speaks HTTP/2 and all five requests share one connection
+    assert list(requests.values()) == [5]